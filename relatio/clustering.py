@@ -9,21 +9,23 @@
 # ..................................................................................................................
 # ..................................................................................................................
 
+import hashlib
+import os
+import sqlite3
 import time
 import warnings
-from collections import Counter
-from copy import deepcopy
-from typing import List, Optional, Union
+from collections import Counter, defaultdict
+from itertools import compress
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import gensim.downloader as api
 import numpy as np
 import tensorflow_hub as hub
 from gensim.models import Word2Vec
-from numpy.linalg import norm
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from tqdm import tqdm
 
-from .utils import count_values, count_words
+from .utils import count_words
 
 
 def compute_sif_weights(words_counter: dict, alpha: Optional[float] = 0.001) -> dict:
@@ -50,6 +52,160 @@ def compute_sif_weights(words_counter: dict, alpha: Optional[float] = 0.001) ->
     return sif_dict
 
 
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+
+    """
+
+    A function that scales the rows of a two-dimensional array to unit length, in place.
+
+    Args:
+        vectors: a two-dimensional numpy array (number of vectors, dimension of the embedding space)
+
+    Returns:
+        The same array, with normalized rows (rows of zeros are left unchanged)
+
+    Example:
+        >>> normalize_vectors(np.array([[3.0, 4.0], [0.0, 0.0]]))
+        array([[0.6, 0.8],
+               [0. , 0. ]])
+
+    """
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.maximum(norms, np.finfo(vectors.dtype).tiny)
+
+    return vectors
+
+
+class EmbeddingsCache:
+
+    """
+
+    A disk-backed cache of embedding vectors, to avoid recomputing them between runs.
+
+    The vectors of a given embeddings model are appended to a float32 file (read back as a numpy memmap)
+    and a sqlite index maps the hash of each phrase to its row in that file.
+
+    Example:
+        >>> import shutil, tempfile
+        >>> with tempfile.TemporaryDirectory() as cache_dir:
+        ...     cache = EmbeddingsCache(cache_dir, "model")
+        ...     empty = cache.get(["a b"])
+        ...     cache.put(["a b", "c"], np.array([[1.0, 2.0], [3.0, 4.0]]))
+        ...     hits = EmbeddingsCache(cache_dir, "model").get(["c", "d", "a b"])
+        ...     other_model = EmbeddingsCache(cache_dir, "other model").get(["c"])
+        ...     os.remove(cache._vectors_path)
+        ...     no_vectors_file = cache.get(["a b", "c"])
+        ...     cache.put(["c"], np.array([[3.0, 4.0]]))
+        ...     os.remove(cache._index_path)
+        ...     no_index_file = cache.get(["c"])
+        ...     shutil.rmtree(cache._dir)
+        ...     no_cache_dir = cache.get(["c"])
+        ...     cache.put(["c"], np.array([[3.0, 4.0]]))
+        ...     recreated = cache.get(["c"])
+        >>> empty
+        {}
+        >>> sorted(hits)
+        ['a b', 'c']
+        >>> hits["c"]
+        array([[3., 4.]], dtype=float32)
+        >>> other_model
+        {}
+        >>> no_vectors_file
+        {}
+        >>> no_index_file, no_cache_dir
+        ({}, {})
+        >>> recreated
+        {'c': array([[3., 4.]], dtype=float32)}
+
+    """
+
+    def __init__(self, cache_dir: str, model_id: str):
+        self._model_id = model_id
+        self._dir = os.path.join(
+            cache_dir, hashlib.blake2b(model_id.encode(), digest_size=16).hexdigest()
+        )
+        self._vectors_path = os.path.join(self._dir, "vectors.f32")
+        self._index_path = os.path.join(self._dir, "index.sqlite")
+        self._connect().close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # the cache files may have been removed since the cache was created (or unpickled elsewhere)
+        os.makedirs(self._dir, exist_ok=True)
+        con = sqlite3.connect(self._index_path)
+        with con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER)"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)"
+            )
+        return con
+
+    def _hash(self, phrase: str) -> str:
+        return hashlib.blake2b(
+            f"{self._model_id}|{phrase}".encode(), digest_size=16
+        ).hexdigest()
+
+    def get(self, phrases: List[str]) -> Dict[str, np.ndarray]:
+        """Return the vectors stored for the given phrases, as a dict {phrase: (1, dim) array}."""
+        hashes = {self._hash(phrase): phrase for phrase in phrases}
+        found: Dict[str, int] = {}
+        con = self._connect()
+        with con:
+            dim = con.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            keys = list(hashes) if dim is not None else []
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                query = "SELECT key, row FROM vectors WHERE key IN (%s)" % ",".join(
+                    "?" * len(chunk)
+                )
+                found.update(con.execute(query, chunk).fetchall())
+        con.close()
+
+        # the vectors file may be missing or shorter than the index says, the phrases are then cache misses
+        n_rows = 0
+        if found and os.path.isfile(self._vectors_path):
+            dim = dim[0]
+            n_rows = os.path.getsize(self._vectors_path) // (4 * dim)
+        found = {key: row for key, row in found.items() if row < n_rows}
+
+        if not found:
+            return {}
+
+        vecs = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r", shape=(n_rows, dim)
+        )
+        rows = np.fromiter(found.values(), dtype=np.int64, count=len(found))
+        hits = np.array(vecs[rows])
+        del vecs
+
+        return {hashes[key]: hits[i : i + 1] for i, key in enumerate(found)}
+
+    def put(self, phrases: List[str], vecs: np.ndarray):
+        """Append the vectors of the given phrases (one row per phrase) to the cache."""
+        if not phrases:
+            return
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        dim = vecs.shape[1]
+        con = self._connect()
+        with con:
+            con.execute("INSERT OR IGNORE INTO meta VALUES ('dim', ?)", (dim,))
+            start = 0
+            if os.path.isfile(self._vectors_path):
+                start = os.path.getsize(self._vectors_path) // (4 * dim)
+            # rows past the end of the vectors file (e.g. if it was removed) would point to the new vectors
+            con.execute("DELETE FROM vectors WHERE row >= ?", (start,))
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(4 * dim * start)
+                f.write(vecs.tobytes())
+            con.executemany(
+                "INSERT OR REPLACE INTO vectors VALUES (?, ?)",
+                [(self._hash(phrase), start + i) for i, phrase in enumerate(phrases)],
+            )
+        con.close()
+
+
 class USE:
 
     """
@@ -61,12 +217,37 @@ class USE:
 
     """
 
-    def __init__(self, path: str):
+    def __init__(self, path: str, cache_dir: Optional[str] = None):
         self._embed = hub.load(path)
+        self._cache: Dict[str, Optional[np.ndarray]] = {}
+        self._disk_cache = (
+            EmbeddingsCache(cache_dir, f"USE|{path}") if cache_dir is not None else None
+        )
+
+    def __getstate__(self):
+        # the cached vectors are not saved with the model
+        state = self.__dict__.copy()
+        state["_cache"] = {}
+        return state
+
+    def __setstate__(self, state):
+        # models pickled before the caches were added have neither of them
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_cache", {})
+        self.__dict__.setdefault("_disk_cache", None)
 
     def __call__(self, tokens: List[str]) -> np.ndarray:
         return self._embed([" ".join(tokens)]).numpy()[0]
 
+    def embed_batch(self, sentences: List[str], batch_size: int = 256) -> np.ndarray:
+        """Embed sentences with one model call per batch of batch_size sentences."""
+        return np.concatenate(
+            [
+                self._embed(sentences[i : i + batch_size]).numpy()
+                for i in range(0, len(sentences), batch_size)
+            ]
+        )
+
 
 class SIF_word2vec:
 
@@ -84,6 +265,7 @@ class SIF_word2vec:
         sentences=List[str],
         alpha: Optional[float] = 0.001,
         normalize: bool = True,
+        cache_dir: Optional[str] = None,
     ):
 
         self._model = self._load_keyed_vectors(path)
@@ -94,22 +276,99 @@ class SIF_word2vec:
 
         self._vocab = self._model.vocab
 
+        self._build_lookup()
+
         self._normalize = normalize
 
+        self._cache: Dict[str, Optional[np.ndarray]] = {}
+
+        # SIF vectors depend on the corpus word frequencies, hence the weights in the model id
+        self._disk_cache = None
+        if cache_dir is not None:
+            weights_hash = hashlib.blake2b(
+                self._sif_weights.tobytes(), digest_size=16
+            ).hexdigest()
+            self._disk_cache = EmbeddingsCache(
+                cache_dir,
+                f"{type(self).__name__}|{path}|{normalize}|{weights_hash}",
+            )
+
     def _load_keyed_vectors(self, path):
         return Word2Vec.load(path).wv
 
+    def _build_lookup(self):
+        # rows of the embedding matrix for the words of the corpus, and SIF weights aligned with these rows
+        self._key_to_row = {
+            word: self._vocab[word].index
+            for word in self._sif_dict
+            if word in self._vocab
+        }
+        self._vectors = np.ascontiguousarray(self._model.vectors, dtype=np.float32)
+        self._sif_weights = np.zeros(len(self._vocab), dtype=np.float32)
+        for word, row in self._key_to_row.items():
+            self._sif_weights[row] = self._sif_dict[word]
+
+    def __getstate__(self):
+        # the cached vectors and the lookup arrays derived from the model are not saved with it
+        state = self.__dict__.copy()
+        for name in ["_key_to_row", "_vectors", "_sif_weights"]:
+            state.pop(name, None)
+        state["_cache"] = {}
+        return state
+
+    def __setstate__(self, state):
+        # models pickled before the caches were added have neither of them
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_cache", {})
+        self.__dict__.setdefault("_disk_cache", None)
+        self._build_lookup()
+
     def __call__(self, tokens: List[str]):
-        res = np.mean(
-            [self._sif_dict[token] * self._model[token] for token in tokens], axis=0
-        )
+        return self.embed_batch([tokens])[0]
+
+    def embed_batch(
+        self, tokens_list: List[List[str]], batch_size: int = 4096
+    ) -> np.ndarray:
+        """Embed non-empty lists of in-vocabulary tokens into one array, normalized at once."""
+        key_to_row = self._key_to_row
+        weights = self._sif_weights
+        vectors = self._vectors
+        res = np.empty((len(tokens_list), vectors.shape[1]), dtype=np.float32)
+        for start in range(0, len(tokens_list), batch_size):
+            batch = tokens_list[start : start + batch_size]
+            # weighted token vectors of all the phrases of the batch, averaged per phrase at once
+            rows = [key_to_row[token] for tokens in batch for token in tokens]
+            counts = np.fromiter(map(len, batch), dtype=np.int64, count=len(batch))
+            offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            weighted = np.take(vectors, rows, axis=0) * weights[rows][:, None]
+            res[start : start + len(batch)] = (
+                np.add.reduceat(weighted, offsets, axis=0) / counts[:, None]
+            )
         if self._normalize:
-            res = res / norm(res)
+            normalize_vectors(res)
         return res
 
     def most_similar(self, v):
         return self._model.most_similar(positive=[v], topn=1)[0]
 
+    def most_similar_batch(
+        self, vecs: np.ndarray, batch_size: int = 65536
+    ) -> List[str]:
+        """Find the most similar word (cosine similarity) to each vector, one matrix product per block of the vocabulary."""
+        self._model.init_sims()
+        vocab_norm = self._model.vectors_norm
+        queries = normalize_vectors(np.array(vecs, dtype=np.float32))
+        best_sims = np.full(len(queries), -np.inf, dtype=np.float32)
+        best_rows = np.zeros(len(queries), dtype=np.int64)
+        for start in range(0, len(vocab_norm), batch_size):
+            sims = vocab_norm[start : start + batch_size] @ queries.T
+            rows = sims.argmax(axis=0)
+            block_sims = sims[rows, np.arange(len(queries))]
+            better = block_sims > best_sims
+            best_sims[better] = block_sims[better]
+            best_rows[better] = rows[better] + start
+        return [self._model.index2word[row] for row in best_rows]
+
 
 class SIF_keyed_vectors(SIF_word2vec):
 
@@ -131,6 +390,16 @@ class SIF_keyed_vectors(SIF_word2vec):
         return api.load(path)
 
 
+def _has_vector(
+    tokens: List[str], model: Union[USE, SIF_word2vec, SIF_keyed_vectors]
+) -> bool:
+    """Check whether the model can embed the tokens."""
+    if isinstance(model, USE):
+        return True
+    # words both in the corpus (i.e. with a SIF weight) and in the vocabulary of the embeddings
+    return len(tokens) > 0 and all(token in model._key_to_row for token in tokens)
+
+
 def get_vector(tokens: List[str], model: Union[USE, SIF_word2vec, SIF_keyed_vectors]):
 
     """
@@ -145,32 +414,92 @@ def get_vector(tokens: List[str], model: Union[USE, SIF_word2vec, SIF_keyed_vect
          - gensim Keyed Vectors based on a pre-trained model (SIF_keyed_vectors)
 
     Returns:
-        A two-dimensional numpy array (1,dimension of the embedding space)
+        A two-dimensional numpy array (1,dimension of the embedding space), or None if the tokens cannot be embedded
 
     """
 
     if not isinstance(model, (USE, SIF_word2vec, SIF_keyed_vectors)):
         raise TypeError("Union[USE, SIF_Word2Vec, SIF_keyed_vectors]")
 
-    if isinstance(model, SIF_word2vec) or isinstance(model, SIF_keyed_vectors):
-        if not tokens:
-            res = None
-        elif any(token not in model._sif_dict for token in tokens):
-            res = None
-        elif any(token not in model._vocab for token in tokens):
-            res = None
-        else:
-            res = model(tokens)
-            res = np.array(
-                [res]
-            )  # correct format to feed the vectors to sklearn clustering methods
+    # same cache and validity rules (vectors with NaNs or only zeros are discarded) as get_phrase_vectors,
+    # which also returns a new array rather than the cached one
+    vecs, valid = get_phrase_vectors([" ".join(tokens)], model)
+
+    if not valid[0]:
+        return None
+
+    return vecs
+
+
+def get_phrase_vectors(
+    phrases: List[str], model: Union[USE, SIF_word2vec, SIF_keyed_vectors]
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+
+    A function that computes the embedding vectors for a list of phrases.
+
+    Each distinct phrase is embedded at most once: the phrases already in the model's cache
+    (or in its disk cache, if the model was given a cache_dir) are looked up,
+    the remaining ones are embedded together in one batch and added to the cache.
+
+    Args:
+        phrases: list of phrases to embed
+        model: trained embedding model. It can be either:
+         - Universal Sentence Encoders (USE)
+         - a full gensim Word2Vec model (SIF_word2vec)
+         - gensim Keyed Vectors based on a pre-trained model (SIF_keyed_vectors)
+
+    Phrases which cannot be embedded (e.g. out-of-vocabulary tokens), or whose vector contains NaNs or only zeros,
+    are left out of the vectors.
+
+    Returns:
+        A two-dimensional numpy array (number of phrases with a vector, dimension of the embedding space)
+        and a boolean numpy array indicating, for each phrase, whether it has a vector
+
+    """
+
+    tokens_list = [phrase.split() for phrase in phrases]
+    keys = [" ".join(tokens) for tokens in tokens_list]
+
+    missing = {
+        key: tokens for key, tokens in zip(keys, tokens_list) if key not in model._cache
+    }
+
+    if model._disk_cache is not None and missing:
+        for key, vec in model._disk_cache.get(list(missing)).items():
+            model._cache[key] = vec
+            del missing[key]
+
+    if isinstance(model, USE):
+        embeddable = {key: key for key in missing}
     else:
-        res = model(tokens)
-        res = np.array(
-            [res]
-        )  # correct format to feed the vectors to sklearn clustering methods
+        embeddable = {
+            key: tokens for key, tokens in missing.items() if _has_vector(tokens, model)
+        }
 
-    return res
+    if embeddable:
+        vecs = model.embed_batch(list(embeddable.values()))
+        usable = ~(np.isnan(vecs).any(axis=1) | (vecs == 0).all(axis=1))
+        for i, key in enumerate(embeddable):
+            model._cache[key] = vecs[i : i + 1] if usable[i] else None
+        if model._disk_cache is not None:
+            model._disk_cache.put(list(compress(embeddable, usable)), vecs[usable])
+
+    for key in missing:
+        model._cache.setdefault(key, None)
+
+    cached = [model._cache[key] for key in keys]
+    valid = np.fromiter(
+        (vec is not None for vec in cached), dtype=bool, count=len(cached)
+    )
+
+    dim = next((vec.shape[1] for vec in cached if vec is not None), 0)
+    vecs = np.empty((np.count_nonzero(valid), dim), dtype=np.float32)
+    for j, vec in enumerate(compress(cached, valid)):
+        vecs[j] = vec[0]
+
+    return vecs, valid
 
 
 def get_vectors(
@@ -196,27 +525,29 @@ def get_vectors(
 
     """
 
-    role_counts = count_values(postproc_roles, keys=used_roles)
-
-    role_counts = [role.split() for role in list(role_counts)]
-
-    vecs = []
-    for role in role_counts:
-        vec = get_vector(role, model)
-        if vec is not None:
-            vecs.append(vec)
+    # distinct phrases, in order of first appearance
+    phrases = list(
+        dict.fromkeys(
+            phrase
+            for statement in postproc_roles
+            for role, phrase in statement.items()
+            if role in used_roles
+        )
+    )
 
-    vecs = np.concatenate(vecs)
+    vecs, _ = get_phrase_vectors(phrases, model)
 
     return vecs
 
 
 def train_cluster_model(
     vecs,
-    model: Union[USE, SIF_word2vec, SIF_keyed_vectors],
+    model: Optional[Union[USE, SIF_word2vec, SIF_keyed_vectors]],
     n_clusters,
     random_state: Optional[int] = 0,
     verbose: Optional[int] = 0,
+    mini_batch: bool = False,
+    backend: str = "sklearn",
 ):
 
     """
@@ -224,22 +555,60 @@ def train_cluster_model(
     Train a kmeans model on the corpus.
 
     Args:
-        vecs: list of vectors
+        vecs: list of vectors (cast to a contiguous float32 array)
         model: trained embedding model. It can be either:
          - Universal Sentence Encoders (USE)
          - a full gensim Word2Vec model (SIF_word2vec)
          - gensim Keyed Vectors based on a pre-trained model (SIF_keyed_vectors)
+         (not used to fit the kmeans model, it may be None)
         random_state: seed for replication (default is 0)
         verbose: see Scikit-learn documentation for details
+        mini_batch: whether to use Scikit-learn MiniBatchKMeans, much faster on large corpora (default is False)
+        backend: either 'sklearn' or 'cuml' to fit the kmeans model on a GPU with RAPIDS cuML
+        (falls back to 'sklearn' if cuML is not installed)
 
     Returns:
-        A Scikit-learn kmeans model
+        A Scikit-learn (or cuML) kmeans model
 
     """
 
-    kmeans = KMeans(
-        n_clusters=n_clusters, random_state=random_state, verbose=verbose
-    ).fit(vecs)
+    if backend not in ["sklearn", "cuml"]:
+        raise ValueError("backend is either sklearn or cuml.")
+
+    # the embeddings are float32, so are the centroids and the vectors given to kmeans.predict
+    vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+
+    if backend == "cuml":
+        if mini_batch:
+            raise ValueError("mini_batch is not available with the cuml backend.")
+        try:
+            from cuml.cluster import KMeans as cuMLKMeans
+        except ImportError:
+            warnings.warn(
+                "cuML is not installed, the sklearn backend is used instead.",
+                RuntimeWarning,
+            )
+            backend = "sklearn"
+
+    if backend == "cuml":
+        kmeans = cuMLKMeans(
+            n_clusters=n_clusters,
+            random_state=random_state,
+            verbose=verbose,
+            output_type="numpy",
+        ).fit(vecs)
+    elif mini_batch:
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            batch_size=4096,
+            n_init=3,
+            random_state=random_state,
+            verbose=verbose,
+        ).fit(vecs)
+    else:
+        kmeans = KMeans(
+            n_clusters=n_clusters, random_state=random_state, verbose=verbose
+        ).fit(vecs)
 
     return kmeans
 
@@ -271,28 +640,29 @@ def get_clusters(
 
     """
 
-    roles_copy = deepcopy(postproc_roles)
+    roles_copy: List[dict] = [{} for _ in postproc_roles]
 
     if progress_bar:
         print("Assigning clusters to roles...")
         time.sleep(1)
         postproc_roles = tqdm(postproc_roles)
 
+    positions = []
+    phrases = []
     for i, statement in enumerate(postproc_roles):
         for role, tokens in statement.items():
             if role in used_roles:
-                vec = get_vector(tokens.split(), model)
-                if vec is not None:
-                    clu = kmeans.predict(vec)[0]
-                    roles_copy[i][role] = clu
-                else:
-                    roles_copy[i].pop(role, None)
-            else:
-                roles_copy[i].pop(role, None)
-
-    roles_copy = [
-        {str(k + suffix): v for k, v in statement.items()} for statement in roles_copy
-    ]
+                positions.append((i, str(role + suffix)))
+                phrases.append(tokens)
+
+    # each distinct phrase is embedded and assigned to a cluster once, all at once
+    unique_phrases = list(dict.fromkeys(phrases))
+    vecs, valid = get_phrase_vectors(unique_phrases, model)
+    if valid.any():
+        clusters = dict(zip(compress(unique_phrases, valid), kmeans.predict(vecs)))
+        for (i, name), phrase in zip(positions, phrases):
+            if phrase in clusters:
+                roles_copy[i][name] = clusters[phrase]
 
     return roles_copy
 
@@ -314,17 +684,12 @@ def label_clusters_most_freq(
 
     """
 
-    temp = {}
+    temp: Dict[Any, List[str]] = defaultdict(list)
     labels = {}
 
     for i, statement in enumerate(clustering_res):
         for role, cluster in statement.items():
-            tokens = postproc_roles[i][role]
-            cluster_num = cluster
-            if cluster_num not in temp:
-                temp[cluster_num] = [tokens]
-            else:
-                temp[cluster_num].append(tokens)
+            temp[cluster].append(postproc_roles[i][role])
 
     for cluster_num, tokens in temp.items():
         token_most_common = Counter(tokens).most_common(2)
@@ -359,10 +724,8 @@ def label_clusters_most_similar(kmeans, model) -> dict:
 
     """
 
-    labels = {}
+    most_similar_terms = model.most_similar_batch(kmeans.cluster_centers_)
 
-    for i, vec in enumerate(kmeans.cluster_centers_):
-        most_similar_term = model.most_similar(vec)
-        labels[i] = most_similar_term[0]
+    labels = {i: term for i, term in enumerate(most_similar_terms)}
 
     return labels
@@ -9,18 +9,19 @@
 # ..................................................................................................................
 # ..................................................................................................................
 
+import os
 import time
 from collections import Counter
-from copy import deepcopy
-from typing import List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Sequence, Sized, Tuple, Union
 
 import numpy as np
-import spacy
+from spacy.tokens import Doc, DocBin, Span
 from tqdm import tqdm
 
-from .utils import clean_text, is_subsequence
+from .utils import _load_spacy_model, _n_process, clean_text
 
-nlp = spacy.load("en_core_web_sm")
+# NER does not need the tagger, the parser nor the lemmatizer
+NER_EXCLUDE = ("tagger", "parser", "attribute_ruler", "lemmatizer")
 
 
 def mine_entities(
@@ -37,6 +38,9 @@ def mine_entities(
     stem: bool = False,
     tags_to_keep: Optional[List[str]] = None,
     remove_n_letter_words: Optional[int] = None,
+    batch_size: int = 1000,
+    n_process: int = 1,
+    doc_bin_path: Optional[str] = None,
     progress_bar: bool = False,
 ) -> Counter:
 
@@ -47,6 +51,9 @@ def mine_entities(
     Args:
         sentences: list of sentences
         ent_labels: list of entity labels to be considered (see SpaCy documentation)
+        batch_size: number of sentences processed together by SpaCy (see spacy.Language.pipe)
+        n_process: number of processes used by SpaCy (see spacy.Language.pipe), ignored for less than utils.MULTIPROCESSING_THRESHOLD sentences (default is 1)
+        doc_bin_path: path of the DocBin saved by utils.split_into_sentences for the same sentences, if the file exists the sentences are read from it instead of being tokenized again (default is None)
         progress_bar: print a progress bar (default is False)
         For other arguments see utils.clean_text.
 
@@ -55,21 +62,148 @@ def mine_entities(
 
     """
 
-    entities_all = []
+    docs: Sequence[Union[str, Doc]] = sentences
+
+    if (doc_bin_path is not None) and os.path.isfile(doc_bin_path):
+        nlp = _load_spacy_model("en_core_web_sm", NER_EXCLUDE)
+        docs = list(DocBin().from_disk(doc_bin_path).get_docs(nlp.vocab))
+        if len(docs) != len(sentences):
+            raise ValueError(
+                f"{doc_bin_path} holds {len(docs)} sentences instead of {len(sentences)}"
+            )
+
+    return mine_entities_on_docs(
+        docs,
+        ent_labels=ent_labels,
+        remove_punctuation=remove_punctuation,
+        remove_digits=remove_digits,
+        remove_chars=remove_chars,
+        stop_words=stop_words,
+        lowercase=lowercase,
+        strip=strip,
+        remove_whitespaces=remove_whitespaces,
+        lemmatize=lemmatize,
+        stem=stem,
+        tags_to_keep=tags_to_keep,
+        remove_n_letter_words=remove_n_letter_words,
+        batch_size=batch_size,
+        n_process=n_process,
+        progress_bar=progress_bar,
+    )
+
+
+def mine_entities_from_spans(
+    spans: List[Span],
+    ent_labels: Optional[List[str]] = ["PERSON", "NORP", "ORG", "GPE", "EVENT"],
+    remove_punctuation: bool = True,
+    remove_digits: bool = True,
+    remove_chars: str = "",
+    stop_words: Optional[List[str]] = None,
+    lowercase: bool = True,
+    strip: bool = True,
+    remove_whitespaces: bool = True,
+    lemmatize: bool = False,
+    stem: bool = False,
+    tags_to_keep: Optional[List[str]] = None,
+    remove_n_letter_words: Optional[int] = None,
+    batch_size: int = 1000,
+    n_process: int = 1,
+    progress_bar: bool = False,
+) -> Counter:
+
+    """
+
+    Same as mine_entities, for sentences already tokenized by SpaCy (e.g. the output of utils.split_into_sentences with return_docs=True).
+    The sentences are not tokenized again, only the NER pipeline is run on them.
+
+    Args:
+        spans: list of SpaCy spans (one per sentence)
+        For other arguments see mine_entities.
+
+    Returns:
+        Counter with the named entity and its associated frequency on the corpus
+
+    """
+
+    return mine_entities_on_docs(
+        [span.as_doc() for span in spans],
+        ent_labels=ent_labels,
+        remove_punctuation=remove_punctuation,
+        remove_digits=remove_digits,
+        remove_chars=remove_chars,
+        stop_words=stop_words,
+        lowercase=lowercase,
+        strip=strip,
+        remove_whitespaces=remove_whitespaces,
+        lemmatize=lemmatize,
+        stem=stem,
+        tags_to_keep=tags_to_keep,
+        remove_n_letter_words=remove_n_letter_words,
+        batch_size=batch_size,
+        n_process=n_process,
+        progress_bar=progress_bar,
+    )
+
+
+def mine_entities_on_docs(
+    docs: Iterable[Union[str, Doc]],
+    ent_labels: Optional[List[str]] = ["PERSON", "NORP", "ORG", "GPE", "EVENT"],
+    remove_punctuation: bool = True,
+    remove_digits: bool = True,
+    remove_chars: str = "",
+    stop_words: Optional[List[str]] = None,
+    lowercase: bool = True,
+    strip: bool = True,
+    remove_whitespaces: bool = True,
+    lemmatize: bool = False,
+    stem: bool = False,
+    tags_to_keep: Optional[List[str]] = None,
+    remove_n_letter_words: Optional[int] = None,
+    batch_size: int = 1000,
+    n_process: int = 1,
+    progress_bar: bool = False,
+) -> Counter:
+
+    """
+
+    Runs the NER pipeline over SpaCy docs and counts the named entities found in the corpus.
+    Docs are not tokenized again (strings are tokenized as in mine_entities).
+
+    Args:
+        docs: SpaCy docs (one per sentence)
+        For other arguments see mine_entities.
+
+    Returns:
+        Counter with the named entity and its associated frequency on the corpus
+
+    """
+
+    raw_counts: Counter = Counter()
+
+    n_docs = len(docs) if isinstance(docs, Sized) else None
+
+    nlp = _load_spacy_model("en_core_web_sm", NER_EXCLUDE)
+    spacy_docs = nlp.pipe(
+        docs,
+        batch_size=batch_size,
+        n_process=n_process if n_docs is None else _n_process(n_process, n_docs),
+    )
 
     if progress_bar:
         print("Mining named entities...")
         time.sleep(1)
-        sentences = tqdm(sentences)
+        spacy_docs = tqdm(spacy_docs, total=n_docs)
 
-    for sentence in sentences:
-        sentence = nlp(sentence)
-        for ent in sentence.ents:
+    # entities are counted on the fly rather than collected in a list first
+    for doc in spacy_docs:
+        for ent in doc.ents:
             if ent.label_ in ent_labels:
-                entities_all.append(ent.text)
+                raw_counts[ent.text] += 1
 
-    entities_all = clean_text(
-        entities_all,
+    # the same entities are found many times in a corpus, each of them is cleaned once
+    raw_entities = list(raw_counts)
+    clean_entities = clean_text(
+        raw_entities,
         remove_punctuation,
         remove_digits,
         remove_chars,
@@ -83,10 +217,11 @@ def mine_entities(
         remove_n_letter_words,
     )
 
-    # forgetting to remove those will break the pipeline
-    entities_all = [entity for entity in entities_all if entity != ""]
-
-    entity_counts = Counter(entities_all)
+    entity_counts: Counter = Counter()
+    for raw_entity, entity in zip(raw_entities, clean_entities):
+        # forgetting to remove those will break the pipeline
+        if entity != "":
+            entity_counts[entity] += raw_counts[raw_entity]
 
     return entity_counts
 
@@ -117,12 +252,27 @@ def map_entities(  # the output could be a list of dictionaries (for consistency
 
     entities_keys = [el[0] for el in entities.most_common(top_n_entities)]
 
-    entity_index = {
-        role: {entity: np.asarray([], dtype=int) for entity in entities_keys}
-        for role in used_roles
+    # an entity matches a role if all its tokens appear in the role (see utils.is_subsequence)
+    # each entity is indexed by its least common token, so that only the entities sharing
+    # this token with a role are checked
+    entities_tokens = {entity: frozenset(entity.split()) for entity in entities_keys}
+    token_counts = Counter(
+        token for tokens in entities_tokens.values() for token in tokens
+    )
+    candidates: Dict[str, List[str]] = {}
+    always_matching = []
+    for entity, tokens in entities_tokens.items():
+        if tokens:
+            rarest_token = min(tokens, key=token_counts.__getitem__)
+            candidates.setdefault(rarest_token, []).append(entity)
+        else:
+            always_matching.append(entity)
+
+    matches: Dict[str, Dict[str, List[int]]] = {
+        role: {entity: [] for entity in entities_keys} for role in used_roles
     }
 
-    roles_copy = deepcopy(statements)
+    roles_copy = [dict(statement) for statement in statements]
 
     if progress_bar:
         print("Mapping named entities...")
@@ -132,11 +282,23 @@ def map_entities(  # the output could be a list of dictionaries (for consistency
     for i, statement in enumerate(statements):
         for role, role_content in roles_copy[i].items():
             if role in used_roles:
-                for entity in entities_keys:
-                    if is_subsequence(entity.split(), role_content.split()) is True:
-                        entity_index[role][entity] = np.append(
-                            entity_index[role][entity], [i]
-                        )
-                        roles_copy[i][role] = ""
+                role_tokens = set(role_content.split())
+                found = list(always_matching)
+                for token in role_tokens:
+                    for entity in candidates.get(token, []):
+                        if entities_tokens[entity] <= role_tokens:
+                            found.append(entity)
+                for entity in found:
+                    matches[role][entity].append(i)
+                if found:
+                    roles_copy[i][role] = ""
+
+    entity_index = {
+        role: {
+            entity: np.asarray(indices, dtype=int)
+            for entity, indices in role_matches.items()
+        }
+        for role, role_matches in matches.items()
+    }
 
     return entity_index, roles_copy
@@ -14,7 +14,6 @@
 
 import time
 import warnings
-from copy import deepcopy
 from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy as np
@@ -179,28 +178,35 @@ def extract_role_per_sentence(
     word_list = sentence_dict["words"]
     sentence_role_list = []
 
+    text_roles = [
+        role
+        for role in ["ARG0", "ARG1", "ARG2", "B-V", "B-ARGM-MOD"]
+        if role in used_roles
+    ]
+    extract_negation = "B-ARGM-NEG" in used_roles
+
     for statement_dict in sentence_dict["verbs"]:
-        tag_list = statement_dict["tags"]
+        # a single pass over the tags collects the tokens of all the roles
+        toks_per_role: Dict[str, List[str]] = {role: [] for role in text_roles}
+        negation = False
+        for tok, tag in zip(word_list, statement_dict["tags"]):
+            if tag == "O":
+                continue
+            for role in text_roles:
+                if role in tag:
+                    toks_per_role[role].append(tok)
+            if "B-ARGM-NEG" in tag:
+                negation = True
 
         statement_role_dict: Dict[str, Union[str, bool]] = {}
-        for role in ["ARG0", "ARG1", "ARG2", "B-V", "B-ARGM-MOD"]:
-            if role in used_roles:
-                indices_role = [i for i, tok in enumerate(tag_list) if role in tok]
-                toks_role = [
-                    tok for i, tok in enumerate(word_list) if i in indices_role
-                ]
-                statement_role_dict[role] = " ".join(toks_role)
-
-        if "B-ARGM-NEG" in used_roles:
-            role_negation_value = any("B-ARGM-NEG" in tag for tag in tag_list)
-            statement_role_dict["B-ARGM-NEG"] = role_negation_value
-
-        key_to_delete = []
-        for key, value in statement_role_dict.items():
-            if not value:
-                key_to_delete.append(key)
-        for key in key_to_delete:
-            del statement_role_dict[key]
+        for role, toks_role in toks_per_role.items():
+            role_content = " ".join(toks_role)
+            if role_content:
+                statement_role_dict[role] = role_content
+
+        if extract_negation and negation:
+            statement_role_dict["B-ARGM-NEG"] = True
+
         sentence_role_list.append(statement_role_dict)
 
     if not sentence_role_list:
@@ -223,6 +229,7 @@ def process_roles(
     stem: bool = False,
     tags_to_keep: Optional[List[str]] = None,
     remove_n_letter_words: Optional[int] = None,
+    raw_max_length: Optional[int] = None,
     progress_bar: bool = False,
 ) -> List[Dict[str, List]]:
 
@@ -232,50 +239,71 @@ def process_roles(
 
     Args:
         max_length = remove roles of more than n characters (NB: very long roles tend to be uninformative)
+        raw_max_length = remove roles of more than n characters before cleaning them, which saves cleaning roles that would be removed anyway (default is None, i.e. all roles are cleaned)
         progress_bar: print a progress bar (default is False)
         For other arguments see utils.clean_text.
 
     Returns:
         List of processed statements
 
+    Examples:
+        >>> process_roles([{'ARG0': 'the ' * 10 + 'cat', 'B-ARGM-NEG': True}], max_length=5, stop_words=['the'])
+        [{'ARG0': 'cat', 'B-ARGM-NEG': True}]
+        >>> process_roles([{'ARG0': 'the ' * 10 + 'cat', 'B-ARGM-NEG': True}], max_length=5, stop_words=['the'], raw_max_length=25)
+        [{'ARG0': '', 'B-ARGM-NEG': True}]
+        >>> process_roles([{'ARG0': 'The big cat', 'ARG1': 'the mouse'}], max_length=9)
+        [{'ARG0': '', 'ARG1': 'the mouse'}]
+
     """
 
-    roles_copy = deepcopy(statements)
+    roles_copy = [dict(statement) for statement in statements]
 
     if progress_bar:
         print("Cleaning SRL...")
         time.sleep(1)
         statements = tqdm(statements)
 
-    for i, statement in enumerate(statements):
-        for role, role_content in roles_copy[i].items():
+    # Roles are highly repetitive across statements: each distinct role is cleaned
+    # once, with a single call to clean_text, and mapped back onto the statements.
+    raw_roles: Dict[str, None] = {}
+    for statement in statements:
+        for role_content in statement.values():
             if isinstance(role_content, str):
-                res = clean_text(
-                    [role_content],
-                    remove_punctuation=remove_punctuation,
-                    remove_digits=remove_digits,
-                    remove_chars=remove_chars,
-                    stop_words=stop_words,
-                    lowercase=lowercase,
-                    strip=strip,
-                    remove_whitespaces=remove_whitespaces,
-                    lemmatize=lemmatize,
-                    stem=stem,
-                    tags_to_keep=tags_to_keep,
-                    remove_n_letter_words=remove_n_letter_words,
-                )[0]
-                if max_length is not None:
-                    if len(res) <= max_length:
-                        roles_copy[i][role] = res
-                    else:
-                        roles_copy[i][role] = ""
-                else:
-                    roles_copy[i][role] = res
+                raw_roles[role_content] = None
             elif isinstance(role_content, bool):
                 pass
             else:
                 raise ValueError(f"{role_content}")
 
+    cleaned: Dict[str, str] = {}
+    if raw_max_length is not None:
+        cleaned = {role: "" for role in raw_roles if len(role) > raw_max_length}
+
+    unique_roles = [role for role in raw_roles if role not in cleaned]
+    clean_roles = clean_text(
+        unique_roles,
+        remove_punctuation=remove_punctuation,
+        remove_digits=remove_digits,
+        remove_chars=remove_chars,
+        stop_words=stop_words,
+        lowercase=lowercase,
+        strip=strip,
+        remove_whitespaces=remove_whitespaces,
+        lemmatize=lemmatize,
+        stem=stem,
+        tags_to_keep=tags_to_keep,
+        remove_n_letter_words=remove_n_letter_words,
+    )
+
+    if max_length is not None:
+        clean_roles = [role if len(role) <= max_length else "" for role in clean_roles]
+
+    cleaned.update(zip(unique_roles, clean_roles))
+    for statement in roles_copy:
+        for role, role_content in statement.items():
+            if isinstance(role_content, str):
+                statement[role] = cleaned[role_content]
+
     return roles_copy
 
 
@@ -297,7 +325,7 @@ def rename_arguments(
 
     """
 
-    roles_copy = deepcopy(statements)
+    roles_copy = [dict(statement) for statement in statements]
 
     if progress_bar:
         print("Processing raw arguments...")
@@ -14,23 +14,45 @@ import re
 import string
 import time
 from collections import Counter
-from typing import Dict, List, Optional, Tuple
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import spacy
 from nltk import pos_tag
 from nltk.corpus import wordnet
 from nltk.stem import SnowballStemmer, WordNetLemmatizer
+from spacy.tokens import DocBin, Span
 from tqdm import tqdm
 
-nlp = spacy.load("en_core_web_sm", disable=["tagger", "ner", "lemmatizer"])
+
+@lru_cache(maxsize=8)
+def _load_spacy_model(name: str, exclude: Tuple[str, ...] = ()) -> spacy.Language:
+    """Load a SpaCy model once, the first time it is needed"""
+    return spacy.load(name, exclude=list(exclude))
+
+
+# only the parser is used (to split sentences), the other components are not even loaded
+SENTENCE_SPLITTER_EXCLUDE = ("tagger", "attribute_ruler", "lemmatizer", "ner")
+
+# below this number of texts, starting the worker processes of spaCy costs more than it saves
+MULTIPROCESSING_THRESHOLD = 10_000
+
+
+def _n_process(n_process: int, n_texts: int) -> int:
+    """Number of processes to use in spacy.Language.pipe for n_texts texts"""
+    return n_process if n_texts >= MULTIPROCESSING_THRESHOLD else 1
 
 
 def split_into_sentences(
     dataframe: pd.DataFrame,
     output_path: Optional[str] = None,
+    n_process: int = 1,
+    return_docs: bool = False,
+    doc_bin_path: Optional[str] = None,
     progress_bar: bool = False,
-) -> Tuple[List[str], List[str]]:
+) -> Tuple[List[str], Union[List[str], List[Span]]]:
 
     """
 
@@ -39,6 +61,9 @@ def split_into_sentences(
     Args:
         dataframe: a pandas dataframe with one column "id" and one column "doc"
         output_path: path to save the output
+        n_process: number of processes used by SpaCy (see spacy.Language.pipe), ignored for less than MULTIPROCESSING_THRESHOLD documents (default is 1)
+        return_docs: return the sentences as SpaCy spans instead of strings, e.g. to mine entities without tokenizing the sentences again (see named_entity_recognition.mine_entities_from_spans)
+        doc_bin_path: path to save the tokenized sentences as a SpaCy DocBin, which can be reused by named_entity_recognition.mine_entities (default is None)
         progress_bar: print a progress bar (default is False)
 
     Returns:
@@ -46,24 +71,46 @@ def split_into_sentences(
 
     """
 
-    docs = dataframe.to_dict(orient="records")
+    length = len(dataframe)
+
+    sentences: list = []
+    sentence_counts = np.empty(length, dtype=np.int64)
+
+    nlp = _load_spacy_model("en_core_web_sm", SENTENCE_SPLITTER_EXCLUDE)
+    doc_bin = DocBin() if doc_bin_path is not None else None
 
-    sentences: List[str] = []
-    doc_indices: List[str] = []
+    # a plain list is cheaper to dispatch to the worker processes than a pandas Series
+    spacy_docs = nlp.pipe(
+        dataframe["doc"].tolist(), n_process=_n_process(n_process, length)
+    )
 
     if progress_bar:
         print("Splitting into sentences...")
         time.sleep(1)
-        docs = tqdm(docs)
+        spacy_docs = tqdm(spacy_docs, total=length)
+
+    for i, doc in enumerate(spacy_docs):
+        sents = list(doc.sents)
+        if doc_bin is not None:
+            for sent in sents:
+                doc_bin.add(sent.as_doc())
+        if not return_docs:
+            sents = [str(sent) for sent in sents]
+        sentence_counts[i] = len(sents)
+        sentences.extend(sents)
+
+    # each document index is repeated once per sentence of the document
+    doc_indices = np.repeat(dataframe["id"].to_numpy(), sentence_counts).tolist()
 
-    for doc in docs:
-        for sent in nlp(doc["doc"], disable=["tagger", "ner"]).sents:
-            sentences.append(str(sent))
-            doc_indices = doc_indices + [doc["id"]]
+    if doc_bin is not None:
+        doc_bin.to_disk(doc_bin_path)
 
     if output_path is not None:
         with open(output_path, "w") as f:
-            json.dump((doc_indices, sentences), f)
+            if return_docs:
+                json.dump((doc_indices, [str(sent) for sent in sentences]), f)
+            else:
+                json.dump((doc_indices, sentences), f)
 
     return (doc_indices, sentences)
 
@@ -205,6 +252,8 @@ def group_sentences_in_batches(
     return batches
 
 
+# tagging a word with nltk is expensive and the vocabulary is small compared to the number of tokens
+@lru_cache(maxsize=2**18)
 def _get_wordnet_pos(word):
     """Get POS tag"""
     tag = pos_tag([word])[0][1][0].upper()
@@ -286,20 +335,13 @@ def clean_text(
         remove_chars += string.punctuation
     if remove_digits:
         remove_chars += string.digits
-    if remove_chars:
-        sentences = [re.sub(f"[{remove_chars}]", "", str(sent)) for sent in sentences]
+    chars_pattern = re.compile(f"[{remove_chars}]") if remove_chars else None
 
-    # lowercase, strip and remove superfluous white spaces
-    if lowercase:
-        sentences = [sent.lower() for sent in sentences]
-    if strip:
-        sentences = [sent.strip() for sent in sentences]
-    if remove_whitespaces:
-        sentences = [" ".join(sent.split()) for sent in sentences]
+    # the word-level steps are selected once, so that the options are not tested for every word
+    word_steps: List[Callable[[List[str]], List[str]]] = []
 
     # lemmatize
     if lemmatize:
-
         tag_dict = {
             "J": wordnet.ADJ,
             "N": wordnet.NOUN,
@@ -307,59 +349,79 @@ def clean_text(
             "R": wordnet.ADV,
         }
 
-        sentences = [
-            " ".join(
-                [
-                    f_lemmatize(
-                        word, tag_dict.get(_get_wordnet_pos(word), wordnet.NOUN)
-                    )
-                    for word in sent.split()
-                ]
-            )
-            for sent in sentences
-        ]
+        def lemmatize_words(words):
+            return [
+                f_lemmatize(word, tag_dict.get(_get_wordnet_pos(word), wordnet.NOUN))
+                for word in words
+            ]
+
+        word_steps.append(lemmatize_words)
 
     # keep specific nltk tags
     # this step should be performed before stemming, but may be performed after lemmatization
     if tags_to_keep is not None:
-        sentences = [
-            " ".join(
-                [
-                    word
-                    for word in sent.split()
-                    if _get_wordnet_pos(word) in tags_to_keep
-                ]
-            )
-            for sent in sentences
-        ]
+
+        def keep_tags(words):
+            return [word for word in words if _get_wordnet_pos(word) in tags_to_keep]
+
+        word_steps.append(keep_tags)
 
     # stem
     if stem:
         stemmer = SnowballStemmer("english")
-        f_stem = stemmer.stem
+        f_stem = lru_cache(maxsize=None)(stemmer.stem)
 
-        sentences = [
-            " ".join([f_stem(word) for word in sent.split()]) for sent in sentences
-        ]
+        def stem_words(words):
+            return [f_stem(word) for word in words]
+
+        word_steps.append(stem_words)
 
     # drop stopwords
     # stopwords are dropped after the bulk of preprocessing steps, so they should also be preprocessed with the same standards
     if stop_words is not None:
-        sentences = [
-            " ".join([word for word in sent.split() if word not in stop_words])
-            for sent in sentences
-        ]
+        # constant-time membership tests
+        stop_words_set = frozenset(stop_words)
+
+        def drop_stop_words(words):
+            return [word for word in words if word not in stop_words_set]
+
+        word_steps.append(drop_stop_words)
 
     # remove short words < n
     if remove_n_letter_words is not None:
-        sentences = [
-            " ".join(
-                [word for word in sent.split() if len(word) > remove_n_letter_words]
-            )
-            for sent in sentences
-        ]
+        n_letters = remove_n_letter_words
 
-    return sentences
+        def drop_short_words(words):
+            return [word for word in words if len(word) > n_letters]
+
+        word_steps.append(drop_short_words)
+
+    # all the preprocessing steps are applied to a sentence before moving to the next one
+    clean_sentences = []
+
+    for sent in sentences:
+
+        # remove chars
+        if chars_pattern is not None:
+            sent = chars_pattern.sub("", str(sent))
+
+        # lowercase, strip and remove superfluous white spaces
+        if lowercase:
+            sent = sent.lower()
+        if strip:
+            sent = sent.strip()
+        if remove_whitespaces:
+            sent = " ".join(sent.split())
+
+        if word_steps:
+            words = sent.split()
+            for word_step in word_steps:
+                words = word_step(words)
+            sent = " ".join(words)
+
+        clean_sentences.append(sent)
+
+    return clean_sentences
 
 
 def is_subsequence(v1: list, v2: list) -> bool:
@@ -410,7 +472,7 @@ def count_values(
 
     """
 
-    counts: Dict[str, int] = {}
+    counts: Counter = Counter()
 
     if progress_bar:
         print("Computing role frequencies...")
@@ -418,17 +480,17 @@ def count_values(
         dicts = tqdm(dicts)
 
     if keys is None:
-        return Counter()
+        return counts
+
+    used_keys = set(keys)
 
+    # a single pass over the dictionaries, whatever the number of keys
     for el in dicts:
         for key, value in el.items():
-            if key in keys:
-                if value in counts:
-                    counts[value] += 1
-                else:
-                    counts[value] = 1
+            if key in used_keys:
+                counts[value] += 1
 
-    return Counter(counts)
+    return counts
 
 
 def count_words(sentences: List[str]) -> Counter:
@@ -11,7 +11,6 @@
 
 import time
 from collections import Counter
-from copy import deepcopy
 from typing import List, Optional
 
 from nltk.corpus import wordnet
@@ -132,7 +131,7 @@ def clean_verbs(
 
     new_roles_all = []
 
-    roles_copy = deepcopy(statements)
+    roles_copy = [dict(statement) for statement in statements]
 
     if progress_bar:
         print("Cleaning verbs...")
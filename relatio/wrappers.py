@@ -16,6 +16,7 @@ from typing import List, Optional
 
 import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed
 
 from .clustering import (
     USE,
@@ -110,7 +111,11 @@ def build_narrative_model(
     roles_with_embeddings: List[List[str]] = [["ARG0", "ARG1", "ARG2"]],
     embeddings_type: Optional[str] = None,
     embeddings_path: Optional[str] = None,
+    embeddings_cache_dir: Optional[str] = None,
     n_clusters: List[List[int]] = [[1]],
+    mini_batch_kmeans: bool = False,
+    kmeans_backend: str = "sklearn",
+    n_jobs: Optional[int] = None,
     verbose: int = 0,
     random_state: int = 0,
     roles_with_entities: List[str] = ["ARG0", "ARG1", "ARG2"],
@@ -135,7 +140,11 @@ def build_narrative_model(
         embeddings_type: whether the user wants to use USE / Keyed Vectors or a custom pre-trained Word2Vec
         (e.g. "USE" / "gensim_keyed_vectors" / "gensim_full_model")
         embeddings_path: path for the trained embeddings model
+        embeddings_cache_dir: directory where the embedding vectors are cached between runs (default is None, which means no caching to disk)
         n_clusters: number of clusters for the clustering model
+        mini_batch_kmeans: whether to fit the clustering models with sklearn.MiniBatchKMeans (faster on large corpora)
+        kmeans_backend: either 'sklearn' or 'cuml' (GPU), see clustering.train_cluster_model
+        n_jobs: number of clustering models (one per number of clusters) fitted in parallel, see joblib.Parallel (default is None, i.e. sequentially)
         verbose: see sklearn.KMeans documentation for details
         roles_with_entities: list of semantic roles with named entities
         ent_labels: list of entity labels to be considered (see SPaCy documentation)
@@ -326,11 +335,19 @@ def build_narrative_model(
             print("Loading embeddings model...")
 
         if embeddings_type == "gensim_keyed_vectors":
-            model = SIF_keyed_vectors(path=embeddings_path, sentences=sentences)
+            model = SIF_keyed_vectors(
+                path=embeddings_path,
+                sentences=sentences,
+                cache_dir=embeddings_cache_dir,
+            )
         elif embeddings_type == "gensim_full_model":
-            model = SIF_word2vec(path=embeddings_path, sentences=sentences)
+            model = SIF_word2vec(
+                path=embeddings_path,
+                sentences=sentences,
+                cache_dir=embeddings_cache_dir,
+            )
         elif embeddings_type == "USE":
-            model = USE(path=embeddings_path)
+            model = USE(path=embeddings_path, cache_dir=embeddings_cache_dir)
 
         narrative_model["embeddings_model"] = model
 
@@ -346,21 +363,34 @@ def build_narrative_model(
 
             vecs = get_vectors(postproc_roles, model, used_roles=roles)
 
+            # the clustering models are independent from each other and can be fitted in parallel
+            nums_to_train = [
+                num
+                for num in n_clusters[i]
+                if (output_path is None)
+                or not os.path.isfile(output_path + "kmeans_%s_%s.pk" % (i, num))
+            ]
+            trained_kmeans = Parallel(n_jobs=n_jobs)(
+                delayed(train_cluster_model)(
+                    vecs,
+                    None,  # the embeddings model is not needed (nor sent to the workers)
+                    n_clusters=num,
+                    verbose=verbose,
+                    random_state=random_state,
+                    mini_batch=mini_batch_kmeans,
+                    backend=kmeans_backend,
+                )
+                for num in nums_to_train
+            )
+            trained_kmeans = dict(zip(nums_to_train, trained_kmeans))
+
             for num in n_clusters[i]:
 
-                if (output_path is not None) and os.path.isfile(
-                    output_path + "kmeans_%s_%s.pk" % (i, num)
-                ):
+                if num in trained_kmeans:
+                    kmeans = trained_kmeans[num]
+                else:
                     with open(output_path + "kmeans_%s_%s.pk" % (i, num), "rb") as f:
                         kmeans = pk.load(f)
-                else:
-                    kmeans = train_cluster_model(
-                        vecs,
-                        model,
-                        n_clusters=num,
-                        verbose=verbose,
-                        random_state=random_state,
-                    )
 
                 if output_path is not None:
                     with open(output_path + "kmeans_%s_%s.pk" % (i, num), "wb") as f:
@@ -502,18 +532,15 @@ def get_narratives(
             )
 
             if cluster_labeling == "most_frequent":
-                for i, statement in enumerate(clustering_res):
-                    for role, cluster in statement.items():
-                        final_statements[i][role] = narrative_model[
-                            "cluster_labels_most_freq"
-                        ][l][n_clusters[l]][cluster]
-
+                labels = narrative_model["cluster_labels_most_freq"][l][n_clusters[l]]
             if cluster_labeling == "most_similar":
-                for i, statement in enumerate(clustering_res):
-                    for role, cluster in statement.items():
-                        final_statements[i][role] = narrative_model[
-                            "cluster_labels_most_similar"
-                        ][l][n_clusters[l]][cluster]
+                labels = narrative_model["cluster_labels_most_similar"][l][
+                    n_clusters[l]
+                ]
+
+            for i, statement in enumerate(clustering_res):
+                for role, cluster in statement.items():
+                    final_statements[i][role] = labels[cluster]
 
     # Original sentence and document
     for i, index in enumerate(sentence_index):